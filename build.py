@@ -1,15 +1,102 @@
-import distutils.dir_util
+import argparse
+import compileall
+import fnmatch
 import logging
 import os
 import shutil
 import sys
+import time
 from pathlib import Path
+from typing import Tuple
 
 
 LOGGER = logging.getLogger(__name__)
 
+# path names never shipped in the install
+IGNORED_NAMES = ["__pycache__", "*.pyc", "*.pyo", ".pytest_cache"]
 
-def build():
+
+def _is_ignored(name: str) -> bool:
+    return any(fnmatch.fnmatch(name, pattern) for pattern in IGNORED_NAMES)
+
+
+def _is_unchanged(src_path: Path, dst_path: Path) -> bool:
+    """
+    Consider a file unchanged if it has the same size and modification time.
+    """
+    if not dst_path.exists():
+        return False
+    src_stat = src_path.stat()
+    dst_stat = dst_path.stat()
+    same_size = src_stat.st_size == dst_stat.st_size
+    same_mtime = int(src_stat.st_mtime) == int(dst_stat.st_mtime)
+    return same_size and same_mtime
+
+
+def copytree_incremental(src_dir: Path, dst_dir: Path) -> Tuple[int, int, int]:
+    """
+    Mirror the src_dir to dst_dir, only copying the files that changed.
+
+    Files in dst_dir that don't exist in src_dir anymore are removed, with the
+    bytecode of removed modules and the directories left empty.
+
+    Returns:
+        number of files copied, skipped and removed.
+    """
+    copied = skipped = removed = 0
+    expected_paths = set()
+    expected_dirs = set()
+
+    for root, dirnames, filenames in os.walk(src_dir):
+        dirnames[:] = [dirname for dirname in dirnames if not _is_ignored(dirname)]
+        root = Path(root)
+        target_root = dst_dir / root.relative_to(src_dir)
+        target_root.mkdir(parents=True, exist_ok=True)
+        expected_dirs.add(target_root)
+
+        for filename in filenames:
+            if _is_ignored(filename):
+                continue
+            src_path = root / filename
+            dst_path = target_root / filename
+            expected_paths.add(dst_path)
+
+            if _is_unchanged(src_path, dst_path):
+                skipped += 1
+                continue
+
+            LOGGER.debug(f"copying {src_path} to {dst_path} ...")
+            shutil.copy2(src_path, dst_path)
+            copied += 1
+
+    for root, dirnames, filenames in os.walk(dst_dir, topdown=False):
+        root = Path(root)
+        relative_parts = root.relative_to(dst_dir).parts
+        # never touch caches that are not python bytecode, like .pytest_cache
+        if any(_is_ignored(part) for part in relative_parts if part != "__pycache__"):
+            continue
+
+        for filename in filenames:
+            dst_path = root / filename
+            if root.name == "__pycache__":
+                # like "module.cpython-39.pyc" or "module.cpython-39.opt-1.pyc"
+                module_path = root.parent / f"{filename.split('.', 1)[0]}.py"
+                stale = module_path not in expected_paths
+            else:
+                stale = dst_path not in expected_paths and not _is_ignored(filename)
+            if stale:
+                LOGGER.debug(f"removing stale {dst_path}")
+                dst_path.unlink()
+                removed += 1
+
+        if root not in expected_dirs and not any(root.iterdir()):
+            LOGGER.debug(f"removing empty {root}")
+            root.rmdir()
+
+    return copied, skipped, removed
+
+
+def build(compile_python: bool = True, workers: int = 0):
     if not os.getenv("REZ_BUILD_INSTALL") == "1":
         LOGGER.info(f"skipped")
         return
@@ -20,15 +107,33 @@ def build():
     source_dir = Path(os.environ["REZ_BUILD_SOURCE_PATH"])
     target_dir = Path(os.environ["REZ_BUILD_INSTALL_PATH"])
 
+    start_time = time.perf_counter()
+
+    # tests are shipped too as they are executed from the install by rez-test
     frompath = source_dir / "python"
     topath = target_dir / frompath.name
     LOGGER.debug(f"copying {frompath} to {topath} ...")
-    distutils.dir_util.copy_tree(str(frompath), str(topath))
+    copied, skipped, removed = copytree_incremental(frompath, topath)
+    LOGGER.info(
+        f"copied {copied} files, skipped {skipped} unchanged, removed {removed} stale "
+        f"in {time.perf_counter() - start_time:.2f}s"
+    )
 
     frompath = source_dir / "README.md"
-    topath = target_dir
-    LOGGER.debug(f"copying {frompath} to {topath} ...")
-    shutil.copy2(frompath, topath)
+    topath = target_dir / frompath.name
+    if not _is_unchanged(frompath, topath):
+        LOGGER.debug(f"copying {frompath} to {topath} ...")
+        shutil.copy2(frompath, topath)
+
+    if compile_python:
+        compile_time = time.perf_counter()
+        package_dir = target_dir / "python" / "rezbuild_utils"
+        LOGGER.debug(f"byte-compiling {package_dir} ...")
+        if not compileall.compile_dir(str(package_dir), quiet=1, workers=workers):
+            raise RuntimeError(f"Failed to byte-compile {package_dir}")
+        LOGGER.info(f"byte-compiled in {time.perf_counter() - compile_time:.2f}s")
+
+    LOGGER.info(f"build finished in {time.perf_counter() - start_time:.2f}s")
 
 
 if __name__ == "__main__":
@@ -38,4 +143,17 @@ if __name__ == "__main__":
         style="{",
         stream=sys.stdout,
     )
-    build()
+    parser = argparse.ArgumentParser(description="Build the rezbuild_utils package.")
+    parser.add_argument(
+        "--no-compile",
+        action="store_true",
+        help="do not byte-compile the installed python package",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="number of processes to byte-compile with; 0 to use all the cpus",
+    )
+    args = parser.parse_args()
+    build(compile_python=not args.no_compile, workers=args.workers)
@@ -7,9 +7,17 @@ from ._io import set_installed_path_read_only
 from ._io import copytree_to_build
 from ._io import clear_build_dir
 from ._io import copy_and_install_zip
+from ._io import extract_zip_members
+from ._io import staged_install
+from ._io import compile_installed_python
+from ._cache import BuildFingerprint
+from ._cache import restore_cached_build
+from ._cache import store_cached_build
 from ._download import download_and_install_build
 from ._package import preserve_build_attributes
 from ._package import BuildPackageVersion
+from ._package import get_installed_versions
+from ._package import get_previous_version
 from ._pip import install_pip_package
 
 __all__ = [
@@ -21,8 +29,16 @@ __all__ = [
     "copytree_to_build",
     "clear_build_dir",
     "copy_and_install_zip",
+    "extract_zip_members",
+    "staged_install",
+    "compile_installed_python",
     "download_and_install_build",
+    "BuildFingerprint",
+    "restore_cached_build",
+    "store_cached_build",
     "preserve_build_attributes",
     "BuildPackageVersion",
+    "get_installed_versions",
+    "get_previous_version",
     "install_pip_package",
 ]
@@ -0,0 +1,343 @@
+import contextlib
+import getpass
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import uuid
+from pathlib import Path
+from typing import List
+
+from pythonning.filesystem import rmtree
+from pythonning.filesystem import set_path_read_only
+
+
+LOGGER = logging.getLogger(__name__)
+
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock_file(file) -> bool:
+        file.seek(0)
+        try:
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def _lock_file(file):
+        # LK_LOCK only retry for 10 seconds before raising
+        while not _try_lock_file(file):
+            try:
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(file):
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _try_lock_file(file) -> bool:
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def _lock_file(file):
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(file):
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def get_cache_root() -> Path:
+    """
+    Get the directory storing all the caches of this library.
+
+    Can be overridden with the ``REZBUILD_UTILS_CACHE_DIR`` environment variable,
+    else default to a per-user directory in the system temporary directory, so
+    builds running as different users on the same machine don't conflict.
+
+    Returns:
+        filesystem path to a directory that may not exist yet.
+    """
+    cache_root = os.getenv("REZBUILD_UTILS_CACHE_DIR")
+    if cache_root:
+        return Path(cache_root)
+
+    try:
+        user = getpass.getuser()
+    except Exception:
+        # no username can be found in the environment or the password database
+        user = str(os.getuid()) if hasattr(os, "getuid") else "unknown"
+    return Path(tempfile.gettempdir()) / f"rezbuild_utils-{user}"
+
+
+def _get_lock_path(key: str) -> Path:
+    lock_name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return get_cache_root() / "locks" / f"{lock_name}.lock"
+
+
+@contextlib.contextmanager
+def cache_entry_lock(key: str):
+    """
+    Hold an exclusive lock on the given cache entry, shared across processes.
+
+    Used to make concurrent builds wait for each other instead of producing the
+    same cache entry at the same time.
+
+    If the lock can't be acquired (like when the cache directory is not writable),
+    a warning is logged and the context is executed without lock.
+
+    Args:
+        key: any string uniquely identifying the cache entry.
+    """
+    lock_path = _get_lock_path(key)
+    lock_dir = lock_path.parent
+
+    lock_file = None
+    try:
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        lock_file = lock_path.open("a+b")
+        if not _try_lock_file(lock_file):
+            LOGGER.info(f"waiting for another process to release '{key}' ...")
+            _lock_file(lock_file)
+    except OSError as error:
+        LOGGER.warning(f"could not lock '{key}', continuing without lock: {error}")
+        if lock_file:
+            lock_file.close()
+            lock_file = None
+
+    try:
+        yield
+    finally:
+        if lock_file:
+            _unlock_file(lock_file)
+            lock_file.close()
+
+
+@contextlib.contextmanager
+def cache_fill_lock(key: str):
+    """
+    Hold :func:`cache_entry_lock` only until the given cache entry has been filled once.
+
+    Intended for caches managed by other libraries, where reading and filling the
+    cache happen in the same call: the first process fills the entry under the
+    exclusive lock and marks it as filled, then the following processes read it
+    concurrently without waiting for each other.
+
+    The entry is not marked as filled if an exception is raised inside the context.
+
+    Args:
+        key:
+            any string uniquely identifying the cache entry, including anything
+            that would invalidate it (like the source modification time).
+    """
+    filled_marker = _get_lock_path(key).with_suffix(".filled")
+    if not filled_marker.exists():
+        with cache_entry_lock(key):
+            if not filled_marker.exists():
+                yield
+                try:
+                    filled_marker.touch()
+                except OSError as error:
+                    LOGGER.warning(f"could not mark '{key}' as filled: {error}")
+                return
+    yield
+
+
+class BuildFingerprint:
+    """
+    Accumulate the inputs of a build to uniquely identify its result.
+
+    The name, version and variant of the package being built, and the resolve of
+    the build environment, are always part of the fingerprint. So changing the
+    variants or the version of any build dependency (like python) invalidate it.
+
+    Can only be created during rez build.
+
+    Example::
+
+        fingerprint = BuildFingerprint()
+        fingerprint.add(URL, PIP_REQUIREMENT)
+        fingerprint.add_files([Path("build.py")])
+    """
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self.add(
+            os.environ["REZ_BUILD_PROJECT_NAME"],
+            os.environ["REZ_BUILD_PROJECT_VERSION"],
+            os.getenv("REZ_BUILD_VARIANT_INDEX", ""),
+            os.getenv("REZ_BUILD_VARIANT_REQUIRES", ""),
+            os.getenv("REZ_USED_RESOLVE", ""),
+        )
+
+    def _update(self, data: bytes):
+        # prefix with the length so consecutive values can't be ambiguous
+        self._hash.update(len(data).to_bytes(8, "little"))
+        self._hash.update(data)
+
+    def _update_file(self, path: Path, chunk_size: int = 1024 * 1024):
+        # same length prefix than _update, but without loading the whole file
+        self._hash.update(path.stat().st_size.to_bytes(8, "little"))
+        with path.open("rb") as file:
+            while True:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    break
+                self._hash.update(chunk)
+
+    def add(self, *values) -> "BuildFingerprint":
+        """
+        Add arbitrary values to the fingerprint, using their string representation.
+
+        Returns:
+            this instance, for chaining.
+        """
+        for value in values:
+            self._update(str(value).encode("utf-8"))
+        return self
+
+    def add_files(self, files: List[Path]) -> "BuildFingerprint":
+        """
+        Add the content of the given files to the fingerprint.
+
+        Args:
+            files:
+                list of absolute paths or paths relative to the build source directory.
+                Directories are recursively traversed.
+
+        Returns:
+            this instance, for chaining.
+        """
+        source_dir = Path(os.environ["REZ_BUILD_SOURCE_PATH"])
+
+        for file in files:
+            if not file.is_absolute():
+                file = source_dir / file
+
+            if file.is_dir():
+                sub_files = sorted(path for path in file.rglob("*") if path.is_file())
+            else:
+                sub_files = [file]
+
+            for sub_file in sub_files:
+                self._update(sub_file.relative_to(file.parent).as_posix().encode())
+                self._update_file(sub_file)
+
+        return self
+
+    def hexdigest(self) -> str:
+        """
+        Returns:
+            the hexadecimal digest of all the inputs added so far.
+        """
+        return self._hash.hexdigest()
+
+
+def _get_build_cache_entry(fingerprint: BuildFingerprint) -> Path:
+    project_name = os.environ["REZ_BUILD_PROJECT_NAME"]
+    return get_cache_root() / "builds" / project_name / fingerprint.hexdigest()
+
+
+def _copy_writable(src: str, dst: str):
+    # cache entries are read-only but copies can be modified safely
+    shutil.copy2(src, dst)
+    os.chmod(dst, os.stat(dst).st_mode | stat.S_IWUSR)
+
+
+def _link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        _copy_writable(src, dst)
+
+
+def restore_cached_build(fingerprint: BuildFingerprint, hardlink: bool = False) -> bool:
+    """
+    Restore the build install directory from a previous build with the same fingerprint.
+
+    Can only be called during rez build.
+
+    Example::
+
+        if not restore_cached_build(fingerprint):
+            download_and_install_build(URL, "sdk")
+            store_cached_build(fingerprint)
+        set_installed_path_read_only()
+
+    Args:
+        fingerprint: inputs of the build to restore.
+        hardlink:
+            True to hardlink files instead of copying them (fallback to a copy if not
+            possible). Hardlinked files share their content with the cache entry,
+            so they are restored read-only and **must not be modified**.
+            Copied files are restored writable. The other permissions (like the
+            executable bit) are preserved in both cases.
+
+    Returns:
+        True if the build was restored, False if there was no cache for it.
+    """
+    cache_dir = _get_build_cache_entry(fingerprint)
+    if not cache_dir.exists():
+        LOGGER.debug(f"no build cache found at '{cache_dir}'")
+        return False
+
+    install_dir = Path(os.environ["REZ_BUILD_INSTALL_PATH"])
+    LOGGER.info(f"restoring cached build '{cache_dir}' to '{install_dir}' ...")
+    shutil.copytree(
+        cache_dir,
+        install_dir,
+        copy_function=_link_or_copy if hardlink else _copy_writable,
+        dirs_exist_ok=True,
+    )
+    return True
+
+
+def store_cached_build(fingerprint: BuildFingerprint) -> Path:
+    """
+    Store the build install directory in the cache, for the given fingerprint.
+
+    The cache entry is published atomically so concurrent builds never see it
+    partially written, and concurrent builds storing the same entry wait for each
+    other. The files of the cache entry are set read-only so they can't be modified
+    through hardlinked restores.
+
+    Can only be called during rez build.
+
+    Args:
+        fingerprint: inputs that produced the current build.
+
+    Returns:
+        filesystem path to the cache entry directory.
+    """
+    cache_dir = _get_build_cache_entry(fingerprint)
+    with cache_entry_lock(str(cache_dir)):
+        if cache_dir.exists():
+            LOGGER.debug(f"build cache already exists at '{cache_dir}'")
+            return cache_dir
+
+        install_dir = Path(os.environ["REZ_BUILD_INSTALL_PATH"])
+        cache_dir.parent.mkdir(parents=True, exist_ok=True)
+        temp_dir = cache_dir.with_name(f".{cache_dir.name}-{uuid.uuid4().hex[:8]}")
+
+        LOGGER.info(f"storing build '{install_dir}' to cache '{cache_dir}' ...")
+        try:
+            shutil.copytree(install_dir, temp_dir)
+            for path in temp_dir.rglob("*"):
+                if path.is_file():
+                    set_path_read_only(path)
+            os.rename(temp_dir, cache_dir)
+        except BaseException:
+            rmtree(temp_dir, ignore_errors=True)
+            raise
+
+    return cache_dir
@@ -1,27 +1,251 @@
+import contextlib
+import hashlib
 import logging
 import os
 import shutil
 import tempfile
+import urllib.error
+import urllib.request
+import uuid
 from pathlib import Path
+from typing import Callable
+from typing import List
+from typing import Optional
 
 from pythonning.web import download_file
-from pythonning.filesystem import extract_zip
 from pythonning.filesystem import rmtree
 from pythonning.progress import catch_download_progress
 
+from ._cache import cache_entry_lock
+from ._cache import cache_fill_lock
+from ._cache import get_cache_root
+from ._io import check_disk_space
+from ._io import extract_zip_members
+from ._io import get_zip_members_size
+
 
 LOGGER = logging.getLogger(__name__)
 
 
+def _get_url_size(url: str) -> Optional[int]:
+    """
+    Get the size of the file at the given url without downloading it.
+
+    Returns:
+        size in bytes or None if the server doesn't provide it.
+    """
+    request = urllib.request.Request(url, method="HEAD")
+    try:
+        with urllib.request.urlopen(request) as response:
+            size = response.headers.get("Content-Length")
+    except OSError as error:
+        LOGGER.debug(f"could not get size of '{url}': {error}")
+        return None
+    return int(size) if size else None
+
+
+def _write_stream_sha256(
+    stream,
+    target_path: Path,
+    total_size: int = -1,
+    step_callback: Optional[Callable[[int, int, int], None]] = None,
+    chunk_size: int = 1024 * 1024,
+) -> str:
+    """
+    Write the given binary stream to a file while hashing the bytes.
+
+    The target file is deleted if the writing fail.
+
+    Args:
+        stream: binary file-like object to read from.
+        target_path: filesystem path to a non-existing file to write.
+        total_size: number of bytes expected to be read, -1 if unknown.
+        step_callback:
+            called after each chunk with the chunk index, the chunk size
+            and the total size.
+        chunk_size: number of bytes to read at once.
+
+    Returns:
+        the hexadecimal sha256 digest of the written bytes.
+    """
+    hasher = hashlib.sha256()
+    try:
+        with target_path.open("wb") as file:
+            chunk_index = 0
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                file.write(chunk)
+                chunk_index += 1
+                if step_callback:
+                    step_callback(chunk_index, chunk_size, total_size)
+    except BaseException:
+        if target_path.exists():
+            target_path.unlink()
+        raise
+
+    return hasher.hexdigest()
+
+
+def _download_file_sha256(
+    url: str,
+    target_path: Path,
+    expected_sha256: str,
+    step_callback: Optional[Callable[[int, int, int], None]] = None,
+    size_callback: Optional[Callable[[int], None]] = None,
+):
+    """
+    Download the given url while hashing the bytes as they are received.
+
+    The target file is deleted if the transfer fail or if the hash doesn't match.
+
+    Args:
+        url: url to download from, ensure it's a file.
+        target_path: filesystem path to a non-existing file to write.
+        expected_sha256: hexadecimal sha256 digest the downloaded file must have.
+        step_callback:
+            called after each chunk with the chunk index, the chunk size
+            and the total size (-1 if unknown).
+        size_callback:
+            called with the Content-Length of the response before any byte is written,
+            if the server provides it. Can raise to abort the download.
+    """
+    with urllib.request.urlopen(url) as response:
+        total_size = int(response.headers.get("Content-Length") or -1)
+        if size_callback and total_size >= 0:
+            size_callback(total_size)
+        sha256 = _write_stream_sha256(response, target_path, total_size, step_callback)
+
+    if sha256 != expected_sha256.lower():
+        target_path.unlink()
+        raise ValueError(
+            f"Downloaded file from '{url}' has sha256 '{sha256}' "
+            f"but '{expected_sha256}' was expected."
+        )
+
+
+def _get_download_cache_path(sha256: str) -> Path:
+    return get_cache_root() / "downloads" / sha256.lower()
+
+
+def _copy_cached_file(
+    cache_path: Path,
+    target_path: Path,
+    expected_sha256: str,
+    step_callback: Optional[Callable[[int, int, int], None]] = None,
+) -> bool:
+    """
+    Copy a published cache entry to the target path while verifying its hash.
+
+    Published entries are immutable so they are read without lock. A corrupted entry
+    is evicted, unless it was already replaced by another process.
+
+    Returns:
+        True if the verified file was copied, False if the entry is missing or corrupted.
+    """
+    try:
+        cache_stat = cache_path.stat()
+        with cache_path.open("rb") as cache_file:
+            LOGGER.info(f"using cached download '{cache_path}'")
+            sha256 = _write_stream_sha256(
+                cache_file,
+                target_path,
+                cache_stat.st_size,
+                step_callback,
+            )
+    except FileNotFoundError:
+        return False
+
+    if sha256 == expected_sha256.lower():
+        return True
+
+    LOGGER.warning(
+        f"cached download '{cache_path}' is corrupted (sha256 '{sha256}'); evicting it"
+    )
+    target_path.unlink()
+    with cache_entry_lock(str(cache_path)):
+        try:
+            if cache_path.stat().st_ino == cache_stat.st_ino:
+                cache_path.unlink()
+        except FileNotFoundError:
+            pass
+    return False
+
+
+def _download_verified_file(
+    url: str,
+    target_path: Path,
+    expected_sha256: str,
+    use_cache: bool,
+    step_callback: Optional[Callable[[int, int, int], None]] = None,
+    size_callback: Optional[Callable[[int], None]] = None,
+):
+    """
+    Download the given url and check its hash, using a cache keyed by the hash.
+
+    Cache entries are only created from verified downloads, and are verified again
+    while being copied out of the cache: a corrupted entry is evicted and downloaded
+    again. Concurrent processes downloading the same file wait for the first one
+    and reuse its download. The lock is only held to check and publish the entry,
+    so copies out of the cache happen concurrently.
+
+    ``size_callback`` is only called when the file is downloaded from the network,
+    see :func:`_download_file_sha256`.
+    """
+    if not use_cache:
+        _download_file_sha256(
+            url, target_path, expected_sha256, step_callback, size_callback
+        )
+        return
+
+    cache_path = _get_download_cache_path(expected_sha256)
+    if _copy_cached_file(cache_path, target_path, expected_sha256, step_callback):
+        return
+
+    with cache_entry_lock(str(cache_path)):
+        published = cache_path.exists()
+        if not published:
+            _download_file_sha256(
+                url, target_path, expected_sha256, step_callback, size_callback
+            )
+
+            LOGGER.debug(f"caching download to '{cache_path}'")
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_name = f".{cache_path.name}-{uuid.uuid4().hex[:8]}"
+            temp_path = cache_path.with_name(temp_name)
+            shutil.copy2(target_path, temp_path)
+            os.replace(temp_path, cache_path)
+            return
+
+    # published by another process while we were waiting for the lock
+    if _copy_cached_file(cache_path, target_path, expected_sha256, step_callback):
+        return
+    _download_file_sha256(
+        url, target_path, expected_sha256, step_callback, size_callback
+    )
+
+
 def download_and_install_build(
     url: str,
     install_dir_name: str,
     extract_if_zip: bool = True,
     use_cache: bool = False,
+    members: Optional[List[str]] = None,
+    strip_components: int = 0,
+    expected_sha256: Optional[str] = None,
+    extract_callback: Optional[Callable[[int, int], None]] = None,
 ) -> Path:
     """
     Download the given url
 
+    The free disk space required is checked before the download starts using the
+    Content-Length of the url, and before the copy to the install using the zip
+    central directory. When ``expected_sha256`` is specified, the Content-Length of
+    the download response is used, else a HEAD request is sent if the cache is not used.
+    Files served from the cache are not checked against the network.
+
     Can only be called during rez build.
 
     Args:
@@ -29,7 +253,24 @@ def download_and_install_build(
         install_dir_name:
            name of the directory to put the extracted file in.
         extract_if_zip: if True automatically extract the file if it is a .zip
-        use_cache: True to use the cached downloaded file. Will create it the first time.
+        use_cache:
+            True to use the cached downloaded file. Will create it the first time.
+            Concurrent builds downloading the same url wait for the first one
+            and reuse its download.
+        members:
+            list of glob patterns of the zip members to extract. None to extract all.
+            Only used when the zip is extracted.
+        strip_components:
+            number of leading path components to remove from the extracted members.
+            Only used when the zip is extracted.
+        expected_sha256:
+            hexadecimal sha256 digest the downloaded file must have. The hash is computed
+            while downloading and a ValueError is raised on mismatch.
+            When specified, the cache is keyed by this hash and a cached file is
+            copied directly to the install without going through the temp directory.
+        extract_callback:
+            called during the extraction with the number of bytes extracted so far
+            and the total number of bytes to extract.
 
     Returns:
         directory path where the files have been installed.
@@ -38,36 +279,108 @@ def download_and_install_build(
     project_version = os.environ["REZ_BUILD_PROJECT_VERSION"]
     project_install = Path(os.environ["REZ_BUILD_INSTALL_PATH"])
 
-    prefix = f"{project_name}-{project_version}-"
-    temp_folder = Path(tempfile.mkdtemp(prefix=prefix))
+    zip_install_dir = project_install / install_dir_name
+    zip_path = zip_install_dir / "downloaded.zip"
+    extract = extract_if_zip and zip_path.suffix == ".zip"
 
-    download_path = temp_folder / "downloaded.zip"
+    def _check_download_size(_size: int):
+        required_sizes = [
+            (Path(tempfile.gettempdir()), _size),
+            (zip_install_dir, _size),
+        ]
+        # verified downloads are also copied to the cache, which can share
+        # the temp filesystem: sizes are summed per filesystem.
+        if expected_sha256 and use_cache:
+            required_sizes.append((get_cache_root(), _size))
+        check_disk_space(required_sizes)
 
-    zip_install_dir = project_install / install_dir_name
-    zip_install_dir.mkdir()
+    def _check_install_size(_download_path: Path):
+        required_size = _download_path.stat().st_size
+        if extract:
+            required_size += get_zip_members_size(
+                _download_path, members, strip_components
+            )
+        check_disk_space([(zip_install_dir, required_size)])
 
-    try:
-        LOGGER.info(f"downloading '{url}' to '{download_path}' ...")
+    cache_path = None
+    if expected_sha256 and use_cache:
+        cache_path = _get_download_cache_path(expected_sha256)
+
+    if cache_path and cache_path.exists():
+        check_disk_space([(zip_install_dir, cache_path.stat().st_size)])
+        zip_install_dir.mkdir()
+        LOGGER.info(f"copying cached '{url}' to '{zip_path}' ...")
         with catch_download_progress() as progress:
-            download_file(
+            _download_verified_file(
                 url,
-                download_path,
+                zip_path,
+                expected_sha256=expected_sha256,
                 use_cache=use_cache,
                 step_callback=progress.show_progress,
+                size_callback=_check_download_size,
             )
+        if extract:
+            extracted_size = get_zip_members_size(zip_path, members, strip_components)
+            check_disk_space([(zip_install_dir, extracted_size)])
+
+    else:
+        # we can't know if pythonning serves the file from its cache,
+        # so only send a request when it is not used.
+        if not expected_sha256 and not use_cache:
+            download_size = _get_url_size(url)
+            if download_size is not None:
+                _check_download_size(download_size)
+
+        prefix = f"{project_name}-{project_version}-"
+        temp_folder = Path(tempfile.mkdtemp(prefix=prefix))
+
+        download_path = temp_folder / zip_path.name
+
+        zip_install_dir.mkdir()
+
+        try:
+            LOGGER.info(f"downloading '{url}' to '{download_path}' ...")
+            with catch_download_progress() as progress:
+                if expected_sha256:
+                    _download_verified_file(
+                        url,
+                        download_path,
+                        expected_sha256=expected_sha256,
+                        use_cache=use_cache,
+                        step_callback=progress.show_progress,
+                        size_callback=_check_download_size,
+                    )
+                else:
+                    # concurrent builds wait for the first one to fill the cache, then
+                    # read it concurrently
+                    lock = contextlib.nullcontext()
+                    if use_cache:
+                        lock = cache_fill_lock(f"download_file:{url}")
+                    with lock:
+                        download_file(
+                            url,
+                            download_path,
+                            use_cache=use_cache,
+                            step_callback=progress.show_progress,
+                        )
 
-        # transfer from local machine to build target path
-        LOGGER.info(f"copying '{download_path.name}' to '{project_install}' ...")
-        shutil.copy2(download_path, zip_install_dir)
+            _check_install_size(download_path)
 
-    finally:
-        LOGGER.info(f"removing temporary directory '{temp_folder}'")
-        rmtree(temp_folder)
+            # transfer from local machine to build target path
+            LOGGER.info(f"copying '{download_path.name}' to '{project_install}' ...")
+            shutil.copy2(download_path, zip_install_dir)
 
-    zip_path = zip_install_dir / download_path.name
+        finally:
+            LOGGER.info(f"removing temporary directory '{temp_folder}'")
+            rmtree(temp_folder)
 
-    if extract_if_zip and zip_path.suffix == ".zip":
+    if extract:
         LOGGER.info(f"extracting '{zip_path}' ...")
-        extract_zip(zip_path)
+        extract_zip_members(
+            zip_path,
+            members=members,
+            strip_components=strip_components,
+            callback=extract_callback,
+        )
 
     return zip_install_dir
@@ -1,23 +1,202 @@
+import compileall
+import contextlib
+import errno
+import fnmatch
 import logging
 import os
+import py_compile
 import shutil
+import tempfile
+import uuid
+import zipfile
 from pathlib import Path
+from typing import Callable
 from typing import List
 from typing import Optional
+from typing import Tuple
 
 from pythonning.filesystem import rmtree
 from pythonning.filesystem import set_path_read_only
 from pythonning.filesystem import copytree
 from pythonning.filesystem import copyfile
-from pythonning.filesystem import extract_zip
 from pythonning.progress import ProgressBar
 
+from ._cache import cache_fill_lock
+
 
 LOGGER = logging.getLogger(__name__)
 
 byte_to_MB = 9.5367e-7
 
 
+def check_disk_space(required_sizes: List[Tuple[Path, int]]):
+    """
+    Ensure the filesystems of the given paths have enough free space for the given sizes.
+
+    Sizes required on paths sharing the same filesystem are summed.
+
+    Args:
+        required_sizes:
+            list of filesystem paths (that may not exist yet) with the number of bytes
+            that will be written to them.
+
+    Raises:
+        OSError: with ``errno.ENOSPC`` if a filesystem doesn't have enough free space.
+    """
+    size_by_device = {}
+    for path, size in required_sizes:
+        while not path.exists():
+            path = path.parent
+        device = path.stat().st_dev
+        device_path, device_size = size_by_device.get(device, (path, 0))
+        size_by_device[device] = (device_path, device_size + size)
+
+    for path, size in size_by_device.values():
+        free_size = shutil.disk_usage(path).free
+        LOGGER.debug(
+            f"'{path}' requires {size * byte_to_MB:.2f}MB, "
+            f"{free_size * byte_to_MB:.2f}MB available"
+        )
+        if size > free_size:
+            raise OSError(
+                errno.ENOSPC,
+                f"Not enough disk space on '{path}': {size * byte_to_MB:.2f}MB "
+                f"required but only {free_size * byte_to_MB:.2f}MB available.",
+            )
+
+
+def _get_zip_member_target(
+    member: zipfile.ZipInfo,
+    members: Optional[List[str]],
+    strip_components: int,
+) -> Optional[str]:
+    """
+    Get the relative path a zip member must be extracted to, or None to skip it.
+    """
+    if members and not any(fnmatch.fnmatch(member.filename, m) for m in members):
+        return None
+
+    parts = [part for part in member.filename.split("/") if part]
+    parts = parts[strip_components:]
+    if not parts:
+        return None
+    return "/".join(parts)
+
+
+def get_zip_members_size(
+    zip_path: Path,
+    members: Optional[List[str]] = None,
+    strip_components: int = 0,
+) -> int:
+    """
+    Get the uncompressed size of the zip members that would be extracted.
+
+    Only the zip central directory is read.
+
+    Args:
+        zip_path: filesystem path to an existing .zip file
+        members: see :func:`extract_zip_members`
+        strip_components: see :func:`extract_zip_members`
+
+    Returns:
+        size in bytes.
+    """
+    with zipfile.ZipFile(zip_path, "r") as zip_file:
+        return sum(
+            member.file_size
+            for member in zip_file.infolist()
+            if _get_zip_member_target(member, members, strip_components)
+        )
+
+
+def extract_zip_members(
+    zip_path: Path,
+    members: Optional[List[str]] = None,
+    strip_components: int = 0,
+    remove_zip: bool = True,
+    callback: Optional[Callable[[int, int], None]] = None,
+    chunk_size: int = 1024 * 1024,
+) -> List[Path]:
+    """
+    Extract the given zip in its parent directory, only for the members matching the filters.
+
+    The zip central directory is read first so the members not selected are never
+    decompressed or written to disk.
+
+    Examples:
+
+        The following::
+
+            (zip_path="sdk.zip", members=["sdk-1.2/bin/*", "sdk-1.2/lib/*"], strip_components=1)
+
+        correspond to::
+
+            sdk.zip/sdk-1.2/bin/tool.exe > bin/tool.exe
+            sdk.zip/sdk-1.2/docs/index.html > (skipped)
+
+    Args:
+        zip_path: filesystem path to an existing .zip file
+        members:
+            list of glob patterns (fnmatch syntax) matched against the full member path
+            in the archive (before stripping). A member is extracted if it matches
+            any pattern. None to extract all members.
+        strip_components:
+            number of leading path components to remove from each member path
+            (like tar ``--strip-components``). Members with not enough components are skipped.
+        remove_zip: True to delete the zip file once extracted.
+        callback:
+            called after each chunk written with the number of bytes extracted so far
+            and the total number of bytes to extract.
+        chunk_size: number of bytes to write at once.
+
+    Returns:
+        list of filesystem paths that have been extracted.
+    """
+    target_dir = zip_path.parent
+    target_dir_resolved = target_dir.resolve()
+    extracted = []
+    extracted_size = 0
+
+    with zipfile.ZipFile(zip_path, "r") as zip_file:
+        selected = []
+        for member in zip_file.infolist():
+            member_target = _get_zip_member_target(member, members, strip_components)
+            if member_target:
+                selected.append((member, member_target))
+
+        total_size = sum(member.file_size for member, _ in selected)
+
+        for member, member_target in selected:
+            target_path = target_dir / member_target
+            if target_dir_resolved not in target_path.resolve().parents:
+                raise ValueError(
+                    f"Zip member '{member.filename}' would be extracted outside of "
+                    f"'{target_dir}'."
+                )
+
+            if member.is_dir():
+                target_path.mkdir(parents=True, exist_ok=True)
+                continue
+
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+            with zip_file.open(member) as src, target_path.open("wb") as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    extracted_size += len(chunk)
+                    if callback:
+                        callback(extracted_size, total_size)
+            extracted.append(target_path)
+
+    LOGGER.debug(f"extracted {extracted_size * byte_to_MB:.2f}MB from '{zip_path}'")
+    if remove_zip:
+        zip_path.unlink()
+
+    return extracted
+
+
 def copy_build_files(files: List[Path], target_directory: Optional[list[str]] = None):
     """
     Copy individual file/directories from the source build directory to the build install path.
@@ -118,6 +297,170 @@ def set_installed_path_read_only() -> list[Path]:
     return installed_files
 
 
+def _commit_staged_install(staging_dir: Path, install_dir: Path, replace: bool):
+    """
+    Replace the install directory by the staging directory using renames only.
+    """
+    if not install_dir.exists():
+        os.rename(staging_dir, install_dir)
+        return
+
+    if not any(install_dir.iterdir()):
+        # posix rename atomically replace an empty directory but windows can't,
+        # leaving a short window where the install directory doesn't exist.
+        if os.name == "nt":
+            install_dir.rmdir()
+        os.rename(staging_dir, install_dir)
+        return
+
+    if not replace:
+        raise FileExistsError(
+            f"Cannot commit staged install: '{install_dir}' is not empty."
+        )
+
+    previous_dir = install_dir.with_name(
+        f".{install_dir.name}-previous-{uuid.uuid4().hex[:8]}"
+    )
+    LOGGER.debug(f"moving previous install '{install_dir}' to '{previous_dir}'")
+    os.rename(install_dir, previous_dir)
+    try:
+        os.rename(staging_dir, install_dir)
+    except Exception:
+        os.rename(previous_dir, install_dir)
+        raise
+
+    LOGGER.debug(f"removing previous install '{previous_dir}'")
+    rmtree(previous_dir, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def staged_install(set_read_only: bool = False, replace: bool = False):
+    """
+    Redirect the rez build install path to a staging directory committed on exit.
+
+    The staging directory is a hidden sibling of the install directory, so it lives on
+    the same filesystem and the commit is a single rename. All the functions of this
+    library called inside the context will write to the staging directory.
+
+    The install directory must be empty or not exist, unless ``replace`` is True.
+    When replacing, the existing install content is **discarded** (it is not copied to
+    the staging directory) and the commit is 2 renames: the previous install is moved
+    to a hidden ``.{name}-previous-*`` sibling, then the staging directory takes its
+    place. Between those renames the install directory doesn't exist, and if the
+    process dies at that moment the previous install is left in that hidden sibling.
+
+    If an exception is raised inside the context, the staging directory is removed and
+    the install directory is left untouched.
+
+    Paths returned by the functions called inside the context (like
+    :func:`copy_and_install_zip`) point into the staging directory and don't exist
+    anymore after the commit. Translate them with
+    ``install_dir / path.relative_to(staging_dir)``.
+
+    Example::
+
+        with staged_install(set_read_only=True):
+            download_and_install_build(url, "sdk")
+            copy_build_files([Path("./python/mymodule.py")])
+
+    Args:
+        set_read_only:
+            True to set all the staged paths to read-only before the commit.
+            See :func:`set_installed_path_read_only`.
+        replace:
+            True to allow discarding the content of a non-empty install directory.
+
+    Raises:
+        FileExistsError: if the install directory is not empty and replace is False.
+
+    Returns:
+        context manager yielding the filesystem path to the staging directory.
+    """
+    install_dir = Path(os.environ["REZ_BUILD_INSTALL_PATH"])
+    if not replace and install_dir.exists() and any(install_dir.iterdir()):
+        raise FileExistsError(
+            f"Cannot stage install: '{install_dir}' is not empty; "
+            f"use clear_build_dir() first or pass replace=True."
+        )
+
+    install_dir.parent.mkdir(parents=True, exist_ok=True)
+
+    staging_dir = Path(
+        tempfile.mkdtemp(prefix=f".{install_dir.name}-staging-", dir=install_dir.parent)
+    )
+    # mkdtemp create a directory only accessible to the current user
+    mode_source = install_dir if install_dir.exists() else install_dir.parent
+    os.chmod(staging_dir, mode_source.stat().st_mode)
+
+    LOGGER.debug(f"staging install to '{staging_dir}'")
+    os.environ["REZ_BUILD_INSTALL_PATH"] = str(staging_dir)
+    try:
+        yield staging_dir
+
+        if set_read_only:
+            set_installed_path_read_only()
+
+        LOGGER.info(f"committing staged install '{staging_dir}' to '{install_dir}'")
+        _commit_staged_install(staging_dir, install_dir, replace=replace)
+
+    except BaseException:
+        LOGGER.debug(f"removing staging directory '{staging_dir}'")
+        rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    finally:
+        os.environ["REZ_BUILD_INSTALL_PATH"] = str(install_dir)
+
+
+def compile_installed_python(
+    path: Optional[Path] = None,
+    optimization_levels: Optional[List[int]] = None,
+    invalidation_mode: Optional[py_compile.PycInvalidationMode] = None,
+    workers: int = 0,
+) -> bool:
+    """
+    Recursively byte-compile all the python files in the rez build install dir.
+
+    Must be called before :func:`set_installed_path_read_only` so the ``__pycache__``
+    directories can be created. The bytecode is only used by processes running the
+    same python version than the build one.
+
+    Args:
+        path:
+            filesystem path to an existing directory to compile.
+            If None use the rez build install dir.
+        optimization_levels:
+            list of optimization levels to compile for, as the ``-O`` python argument
+            (0, 1 or 2). If None, use the optimization level of the current interpreter.
+        invalidation_mode:
+            how the python interpreter check the bytecode is up-to-date with its source.
+            If None use the default timestamp-based invalidation.
+        workers: number of processes to compile with. 0 to use all the cpus.
+
+    Returns:
+        True if all the files could be compiled, False if any failed.
+    """
+    install_dir = path or Path(os.environ["REZ_BUILD_INSTALL_PATH"])
+    optimization_levels = optimization_levels or [-1]
+
+    success = True
+    for optimization_level in optimization_levels:
+        LOGGER.debug(
+            f"byte-compiling '{install_dir}' with optimization {optimization_level} ..."
+        )
+        success &= compileall.compile_dir(
+            str(install_dir),
+            quiet=1,
+            optimize=optimization_level,
+            invalidation_mode=invalidation_mode,
+            workers=workers,
+        )
+
+    if not success:
+        LOGGER.warning(f"some python files could not be compiled in '{install_dir}'")
+    return bool(success)
+
+
 def clear_build_dir():
     """
     Remove the content of the build installation directory.
@@ -137,12 +480,20 @@ def copy_and_install_zip(
     dir_name: Optional[str],
     show_progress: bool = True,
     use_cache: bool = True,
+    members: Optional[List[str]] = None,
+    strip_components: int = 0,
 ) -> Path:
     """
     Copy the given zip to the build directory and extract it to the given directory name.
 
     A progress bar can be displayed for the copy operation (and not the extraction).
 
+    Only a subset of the zip can be extracted using ``members`` and ``strip_components``;
+    see :func:`extract_zip_members` for details.
+
+    The free disk space required for the copy and the extraction is checked before
+    starting, using the zip central directory.
+
     Args:
         zip_path: filesystem path to an existing .zip file
         dir_name:
@@ -153,7 +504,12 @@ def copy_and_install_zip(
             True to cache the source zip locally. This might reduce build time
             when the zip is stored on slow network drives and you need to trigger
             the build multiple times in a short period.
-
+            Concurrent builds copying the same zip wait for the first one to fill
+            the cache, then copy from it concurrently.
+        members:
+            list of glob patterns of the zip members to extract. None to extract all.
+        strip_components:
+            number of leading path components to remove from the extracted members.
 
     Returns:
         the path of the directory that contain the extracted zip content
@@ -166,6 +522,14 @@ def copy_and_install_zip(
 
     target_path = target_dir / zip_path.name
 
+    zip_size = zip_path.stat().st_size
+    extracted_size = get_zip_members_size(zip_path, members, strip_components)
+    required_sizes = [(target_dir, zip_size + extracted_size)]
+    if use_cache:
+        # XXX: we assume the cache is stored in the system temporary directory
+        required_sizes.append((Path(tempfile.gettempdir()), zip_size))
+    check_disk_space(required_sizes)
+
     progress = None
     if show_progress:
         progress = ProgressBar(
@@ -177,16 +541,44 @@ def copy_and_install_zip(
         if show_progress:
             progress.set_progress(_chunk * byte_to_MB, new_maximum=_total * byte_to_MB)
 
+    def _extract_callback(_extracted: int, _total: int):
+        if show_progress:
+            progress.set_progress(
+                _extracted * byte_to_MB, new_maximum=_total * byte_to_MB
+            )
+
     LOGGER.info(f"copying zip '{zip_path}' to '{target_path}' ...")
-    progress.start() if progress else None
-    copyfile(
-        zip_path,
+    # concurrent builds wait for the first one to fill the cache, then read it
+    # concurrently
+    lock = contextlib.nullcontext()
+    if use_cache:
+        zip_stat = zip_path.stat()
+        lock = cache_fill_lock(
+            f"copyfile:{zip_path.resolve()}:{zip_stat.st_size}:{zip_stat.st_mtime_ns}"
+        )
+    with lock:
+        progress.start() if progress else None
+        copyfile(
+            zip_path,
+            target_path,
+            callback=_callback,
+            use_cache=use_cache,
+        )
+        progress.end() if progress else None
+
+    LOGGER.info(f"extracting zip '{target_path}'")
+    if show_progress:
+        progress = ProgressBar(
+            prefix=f"extracting {zip_path.name}",
+            suffix="[{bar_index:.2f}MB/{bar_max:.2f}MB] elapsed {elapsed_time:.2f}s",
+        )
+        progress.start()
+    extract_zip_members(
         target_path,
-        callback=_callback,
-        use_cache=use_cache,
+        members=members,
+        strip_components=strip_components,
+        remove_zip=True,
+        callback=_extract_callback,
     )
     progress.end() if progress else None
-
-    LOGGER.info(f"extracting zip '{target_path}'")
-    extract_zip(target_path, remove_zip=True)
     return target_dir
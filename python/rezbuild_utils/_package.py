@@ -1,8 +1,24 @@
+import bisect
 import contextlib
+import functools
 import os
+from pathlib import Path
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
 
 import rez.package_resources
 
+try:
+    from rez.version import Version
+    from rez.version import VersionError
+    from rez.version import VersionRange
+except ImportError:  # rez < 3
+    from rez.vendor.version.version import Version
+    from rez.vendor.version.version import VersionRange
+    from rez.vendor.version.util import VersionError
+
 
 @contextlib.contextmanager
 def preserve_build_attributes():
@@ -28,20 +44,94 @@ def preserve_build_attributes():
         rez.package_resources.package_build_only_keys = initial
 
 
+@functools.lru_cache(maxsize=None)
+def _parse_version(version: str) -> Tuple[Tuple[str, ...], Version]:
+    """
+    Split the given version string to its Knots tokens and parse it as a rez version.
+
+    The rez version is used for comparisons so ordering is the same as in rez.
+    """
+    return tuple(version.split(".")), Version(version)
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_version_range(version_range: str) -> VersionRange:
+    return VersionRange(version_range)
+
+
+@functools.total_ordering
 class BuildPackageVersion:
     """
     An object to manipulate the version attribute following Knots conventions.
 
     It assumes a package with a traditional semver versioning is being built.
 
+    The version string is only parsed once per unique value, and instances can be
+    compared and sorted between each other following the rez version ordering.
+
     **Knots specificities:**
 
     * The **extra-patch** is an additional "sub-patch" token for rez versioning of vendor packages.
+
+    Args:
+        version:
+            version string to parse, like ``1.2.3.0``.
+            If None use the version of the package being built (only during rez build).
     """
 
-    def __init__(self):
-        self._source = os.environ["REZ_BUILD_PROJECT_VERSION"]
-        self._split = self._source.split(".")
+    __slots__ = ("_source", "_split", "_version")
+
+    def __init__(self, version: Optional[str] = None):
+        if version is None:
+            version = os.environ["REZ_BUILD_PROJECT_VERSION"]
+        self._source = version
+        self._split, self._version = _parse_version(version)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}('{self._source}')"
+
+    def __str__(self) -> str:
+        return self._source
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, BuildPackageVersion):
+            return NotImplemented
+        return self._version == other._version
+
+    def __lt__(self, other) -> bool:
+        if not isinstance(other, BuildPackageVersion):
+            return NotImplemented
+        return self._version < other._version
+
+    def __hash__(self) -> int:
+        return hash(self._version)
+
+    @property
+    def rez_version(self) -> Version:
+        """
+        The rez version object corresponding to this version.
+        """
+        return self._version
+
+    def in_range(self, version_range: Union[str, VersionRange]) -> bool:
+        """
+        Args:
+            version_range: rez version range like ``1.2+<2`` or ``==1.2.3.0``.
+
+        Returns:
+            True if this version is contained in the given range.
+        """
+        if isinstance(version_range, str):
+            version_range = _parse_version_range(version_range)
+        return version_range.contains_version(self._version)
+
+    def _get_token(self, index: int, name: str) -> str:
+        try:
+            return self._split[index]
+        except IndexError:
+            raise ValueError(
+                f"Version '{self._source}' doesn't have a {name} token."
+            ) from None
 
     @property
     def full_version(self) -> str:
@@ -54,16 +144,72 @@ class BuildPackageVersion:
 
     @property
     def major(self) -> str:
-        return self._split[0]
+        return self._get_token(0, "major")
 
     @property
     def minor(self) -> str:
-        return self._split[1]
+        return self._get_token(1, "minor")
 
     @property
     def patch(self) -> str:
-        return self._split[2]
+        return self._get_token(2, "patch")
 
     @property
     def extra_patch(self) -> str:
-        return self._split[3]
+        return self._get_token(3, "extra-patch")
+
+
+def get_installed_versions(
+    package_name: str,
+    packages_path: Path,
+    version_range: Optional[str] = None,
+) -> List[BuildPackageVersion]:
+    """
+    Get all the versions of the given package installed in the given package repository.
+
+    Directories that are not valid rez versions are ignored.
+
+    Args:
+        package_name: name of the rez package to find the versions of.
+        packages_path: filesystem path to a rez package repository.
+        version_range: optional rez version range the versions must be contained in.
+
+    Returns:
+        list of versions sorted from lowest to highest.
+    """
+    package_dir = packages_path / package_name
+    if not package_dir.is_dir():
+        return []
+
+    versions = []
+    with os.scandir(package_dir) as entries:
+        for entry in entries:
+            if not entry.is_dir() or entry.name.startswith("."):
+                continue
+            try:
+                version = BuildPackageVersion(entry.name)
+            except VersionError:
+                continue
+            if version_range is None or version.in_range(version_range):
+                versions.append(version)
+
+    versions.sort()
+    return versions
+
+
+def get_previous_version(
+    version: BuildPackageVersion,
+    versions: List[BuildPackageVersion],
+) -> Optional[BuildPackageVersion]:
+    """
+    Get the highest version strictly lower than the given one.
+
+    Args:
+        version: the version to find the previous version of.
+        versions: list of versions to search in, sorted from lowest to highest.
+
+    Returns:
+        a version from ``versions`` or None if there is no lower version.
+    """
+    index = bisect.bisect_left(versions, version)
+    return versions[index - 1] if index else None
@@ -0,0 +1,122 @@
+import logging
+import os
+import stat
+import threading
+from pathlib import Path
+
+from rezbuild_utils._cache import BuildFingerprint
+from rezbuild_utils._cache import cache_entry_lock
+from rezbuild_utils._cache import cache_fill_lock
+from rezbuild_utils._cache import restore_cached_build
+from rezbuild_utils._cache import store_cached_build
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def test_build_cache(tmp_path: Path, data_root_dir: Path, monkeypatch):
+    install_dir = tmp_path / "install"
+    install_dir.mkdir()
+    (install_dir / "foo.txt").write_text("foo")
+    (install_dir / "bin").mkdir()
+    (install_dir / "bin" / "tool").write_text("#!/bin/sh")
+    os.chmod(install_dir / "bin" / "tool", 0o755)
+    monkeypatch.setenv("REZBUILD_UTILS_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("REZ_BUILD_PROJECT_NAME", "foo")
+    monkeypatch.setenv("REZ_BUILD_PROJECT_VERSION", "1.2.3.0")
+    monkeypatch.setenv("REZ_BUILD_SOURCE_PATH", str(data_root_dir / "copybuildfiles01"))
+    monkeypatch.setenv("REZ_BUILD_INSTALL_PATH", str(install_dir))
+    monkeypatch.setenv("REZ_USED_RESOLVE", "python-3.9.13")
+
+    fingerprint = BuildFingerprint().add("https://foo.com/foo.zip")
+    fingerprint.add_files([Path("./somedir/"), Path("./foo.py")])
+    assert not restore_cached_build(fingerprint)
+
+    store_cached_build(fingerprint)
+
+    new_install_dir = tmp_path / "install2"
+    new_install_dir.mkdir()
+    monkeypatch.setenv("REZ_BUILD_INSTALL_PATH", str(new_install_dir))
+    other_fingerprint = BuildFingerprint().add("https://foo.com/foo2.zip")
+    assert not restore_cached_build(other_fingerprint)
+
+    assert restore_cached_build(fingerprint)
+    assert (new_install_dir / "foo.txt").read_text() == "foo"
+    assert os.stat(new_install_dir / "foo.txt").st_mode & stat.S_IWUSR
+    assert stat.S_IMODE(os.stat(new_install_dir / "bin" / "tool").st_mode) == 0o755
+
+    hardlink_install_dir = tmp_path / "install3"
+    hardlink_install_dir.mkdir()
+    monkeypatch.setenv("REZ_BUILD_INSTALL_PATH", str(hardlink_install_dir))
+    assert restore_cached_build(fingerprint, hardlink=True)
+    assert not os.stat(hardlink_install_dir / "foo.txt").st_mode & stat.S_IWUSR
+    tool_mode = stat.S_IMODE(os.stat(hardlink_install_dir / "bin" / "tool").st_mode)
+    assert tool_mode == 0o555
+
+    def _link_unsupported(*args):
+        raise OSError("hardlinks not supported")
+
+    fallback_install_dir = tmp_path / "install4"
+    fallback_install_dir.mkdir()
+    monkeypatch.setenv("REZ_BUILD_INSTALL_PATH", str(fallback_install_dir))
+    with monkeypatch.context() as patch:
+        patch.setattr(os, "link", _link_unsupported)
+        assert restore_cached_build(fingerprint, hardlink=True)
+    tool_mode = stat.S_IMODE(os.stat(fallback_install_dir / "bin" / "tool").st_mode)
+    assert tool_mode == 0o755
+
+    monkeypatch.setenv("REZ_USED_RESOLVE", "python-3.10.11")
+    new_resolve_fingerprint = BuildFingerprint().add("https://foo.com/foo.zip")
+    new_resolve_fingerprint.add_files([Path("./somedir/"), Path("./foo.py")])
+    assert not restore_cached_build(new_resolve_fingerprint)
+
+
+def test_cache_entry_lock(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REZBUILD_UTILS_CACHE_DIR", str(tmp_path / "cache"))
+    acquired = threading.Event()
+
+    def _acquire():
+        with cache_entry_lock("foo"):
+            acquired.set()
+
+    with cache_entry_lock("foo"):
+        thread = threading.Thread(target=_acquire)
+        thread.start()
+        # a different entry is not blocked
+        with cache_entry_lock("bar"):
+            pass
+        assert not acquired.wait(0.2)
+
+    thread.join(5)
+    assert acquired.is_set()
+
+
+def test_cache_entry_lock_unavailable(tmp_path: Path, monkeypatch):
+    # a file where a directory is expected, so the lock can't be created
+    not_a_dir = tmp_path / "file"
+    not_a_dir.write_text("")
+    monkeypatch.setenv("REZBUILD_UTILS_CACHE_DIR", str(not_a_dir / "cache"))
+
+    executed = False
+    with cache_entry_lock("foo"):
+        executed = True
+    assert executed
+
+
+def test_cache_fill_lock(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REZBUILD_UTILS_CACHE_DIR", str(tmp_path / "cache"))
+    filled = threading.Event()
+
+    def _fill():
+        with cache_fill_lock("foo"):
+            filled.set()
+
+    with cache_fill_lock("foo"):
+        pass
+
+    # once filled, the entry lock is not waited for anymore
+    with cache_entry_lock("foo"):
+        thread = threading.Thread(target=_fill)
+        thread.start()
+        assert filled.wait(5)
+    thread.join(5)
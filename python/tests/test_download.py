@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import tempfile
+import threading
+import zipfile
+from pathlib import Path
+
+import pytest
+
+import rezbuild_utils._download
+from rezbuild_utils._cache import cache_entry_lock
+from rezbuild_utils._download import _download_verified_file
+from rezbuild_utils._download import download_and_install_build
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def test_download_verified_file(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REZBUILD_UTILS_CACHE_DIR", str(tmp_path / "cache"))
+    src_path = tmp_path / "source.zip"
+    src_path.write_bytes(b"0123456789" * 1000)
+    sha256 = hashlib.sha256(src_path.read_bytes()).hexdigest()
+    target_path = tmp_path / "downloaded.zip"
+
+    with pytest.raises(ValueError):
+        _download_verified_file(src_path.as_uri(), target_path, "0" * 64, True)
+    assert not target_path.exists()
+
+    _download_verified_file(src_path.as_uri(), target_path, sha256, True)
+    assert target_path.read_bytes() == src_path.read_bytes()
+
+    # the second download must be served from the cache, without waiting for
+    # the entry lock held by another process
+    src_path.unlink()
+    target_path.unlink()
+    cache_path = tmp_path / "cache" / "downloads" / sha256
+    with cache_entry_lock(str(cache_path)):
+        thread = threading.Thread(
+            target=_download_verified_file,
+            args=(src_path.as_uri(), target_path, sha256, True),
+        )
+        thread.start()
+        thread.join(5)
+        assert not thread.is_alive()
+    assert hashlib.sha256(target_path.read_bytes()).hexdigest() == sha256
+
+
+def test_download_verified_file_corrupted_cache(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REZBUILD_UTILS_CACHE_DIR", str(tmp_path / "cache"))
+    src_path = tmp_path / "source.zip"
+    src_path.write_bytes(b"0123456789" * 1000)
+    sha256 = hashlib.sha256(src_path.read_bytes()).hexdigest()
+
+    cache_path = tmp_path / "cache" / "downloads" / sha256
+    cache_path.parent.mkdir(parents=True)
+    cache_path.write_bytes(b"corrupted")
+
+    target_path = tmp_path / "downloaded.zip"
+    _download_verified_file(src_path.as_uri(), target_path, sha256, True)
+    assert target_path.read_bytes() == src_path.read_bytes()
+    assert cache_path.read_bytes() == src_path.read_bytes()
+
+
+def test_download_and_install_build_cached(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REZBUILD_UTILS_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("REZ_BUILD_PROJECT_NAME", "foo")
+    monkeypatch.setenv("REZ_BUILD_PROJECT_VERSION", "1.2.3.0")
+    monkeypatch.setenv("REZ_BUILD_INSTALL_PATH", str(tmp_path / "install"))
+    (tmp_path / "install").mkdir()
+
+    zip_path = tmp_path / "source.zip"
+    with zipfile.ZipFile(zip_path, "w") as zip_file:
+        zip_file.writestr("sdk/bin/tool.exe", "tool")
+        zip_file.writestr("sdk/docs/index.html", "docs")
+    sha256 = hashlib.sha256(zip_path.read_bytes()).hexdigest()
+
+    def _forbidden(*args, **kwargs):
+        raise AssertionError("unexpected call")
+
+    # no HEAD request when the size can be read from the download response
+    monkeypatch.setattr(rezbuild_utils._download, "_get_url_size", _forbidden)
+    install_dir = download_and_install_build(
+        zip_path.as_uri(),
+        "first",
+        use_cache=True,
+        expected_sha256=sha256,
+    )
+    assert (install_dir / "sdk" / "docs" / "index.html").exists()
+
+    # cache hits don't use the temp directory
+    monkeypatch.setattr(tempfile, "mkdtemp", _forbidden)
+    progress = []
+    install_dir = download_and_install_build(
+        zip_path.as_uri(),
+        "second",
+        use_cache=True,
+        members=["sdk/bin/*"],
+        strip_components=1,
+        expected_sha256=sha256,
+        extract_callback=lambda extracted, total: progress.append((extracted, total)),
+    )
+    assert (install_dir / "bin" / "tool.exe").read_text() == "tool"
+    assert progress == [(4, 4)]
+
+
+def test_download_and_install_build_disk_space(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("REZBUILD_UTILS_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("REZ_BUILD_PROJECT_NAME", "foo")
+    monkeypatch.setenv("REZ_BUILD_PROJECT_VERSION", "1.2.3.0")
+    monkeypatch.setenv("REZ_BUILD_INSTALL_PATH", str(tmp_path / "install"))
+    (tmp_path / "install").mkdir()
+
+    src_path = tmp_path / "source.zip"
+    src_path.write_bytes(b"0123456789" * 1000)
+    sha256 = hashlib.sha256(src_path.read_bytes()).hexdigest()
+
+    required_sizes = []
+
+    def _check_disk_space(_required_sizes):
+        required_sizes.extend(_required_sizes)
+
+    monkeypatch.setattr(rezbuild_utils._download, "check_disk_space", _check_disk_space)
+    download_and_install_build(
+        src_path.as_uri(),
+        "sdk",
+        extract_if_zip=False,
+        use_cache=True,
+        expected_sha256=sha256,
+    )
+    assert (tmp_path / "cache", 10000) in required_sizes
@@ -1,12 +1,19 @@
+import errno
 import logging
 import os
 import shutil
+import zipfile
 from pathlib import Path
 
 import pytest
 
+from rezbuild_utils._io import check_disk_space
+from rezbuild_utils._io import compile_installed_python
 from rezbuild_utils._io import copy_build_files
+from rezbuild_utils._io import extract_zip_members
+from rezbuild_utils._io import get_zip_members_size
 from rezbuild_utils._io import set_installed_path_read_only
+from rezbuild_utils._io import staged_install
 
 
 LOGGER = logging.getLogger(__name__)
@@ -86,3 +93,98 @@ def test_set_installed_files_read_only(
     test_file2 = install_dir / "somedir" / "file.py"
     with pytest.raises(PermissionError):
         test_file2.unlink()
+
+
+def test_extract_zip_members(tmp_path: Path):
+    zip_path = tmp_path / "sdk.zip"
+    with zipfile.ZipFile(zip_path, "w") as zip_file:
+        zip_file.writestr("sdk-1.2/bin/tool.exe", "tool")
+        zip_file.writestr("sdk-1.2/lib/core.dll", "core")
+        zip_file.writestr("sdk-1.2/docs/index.html", "docs")
+        zip_file.writestr("README.txt", "readme")
+
+    members = ["sdk-1.2/bin/*", "sdk-1.2/lib/*", "README.txt"]
+    assert get_zip_members_size(zip_path, members, strip_components=1) == 8
+
+    progress = []
+    extracted = extract_zip_members(
+        zip_path,
+        members=members,
+        strip_components=1,
+        callback=lambda extracted, total: progress.append((extracted, total)),
+    )
+    assert progress == [(4, 8), (8, 8)]
+
+    assert not zip_path.exists()
+    assert sorted(extracted) == [
+        tmp_path / "bin" / "tool.exe",
+        tmp_path / "lib" / "core.dll",
+    ]
+    assert (tmp_path / "bin" / "tool.exe").read_text() == "tool"
+    assert not (tmp_path / "docs").exists()
+    assert not (tmp_path / "sdk-1.2").exists()
+
+
+def test_staged_install(tmp_path: Path, data_root_dir: Path, monkeypatch):
+    install_dir = tmp_path / "install"
+    install_dir.mkdir()
+    monkeypatch.setenv("REZ_BUILD_SOURCE_PATH", str(data_root_dir / "copybuildfiles01"))
+    monkeypatch.setenv("REZ_BUILD_INSTALL_PATH", str(install_dir))
+
+    with staged_install() as staging_dir:
+        assert os.environ["REZ_BUILD_INSTALL_PATH"] == str(staging_dir)
+        copy_build_files([Path("./foo.py")])
+        assert not (install_dir / "foo.py").exists()
+
+    assert os.environ["REZ_BUILD_INSTALL_PATH"] == str(install_dir)
+    assert (install_dir / "foo.py").exists()
+    assert not staging_dir.exists()
+    assert list(tmp_path.iterdir()) == [install_dir]
+
+
+def test_staged_install_error(tmp_path: Path, data_root_dir: Path, monkeypatch):
+    install_dir = tmp_path / "install"
+    install_dir.mkdir()
+    (install_dir / "previous.txt").write_text("previous")
+    monkeypatch.setenv("REZ_BUILD_SOURCE_PATH", str(data_root_dir / "copybuildfiles01"))
+    monkeypatch.setenv("REZ_BUILD_INSTALL_PATH", str(install_dir))
+
+    with pytest.raises(FileExistsError):
+        with staged_install():
+            pass
+
+    with pytest.raises(RuntimeError):
+        with staged_install(replace=True):
+            copy_build_files([Path("./foo.py")])
+            raise RuntimeError("build failed")
+
+    assert os.environ["REZ_BUILD_INSTALL_PATH"] == str(install_dir)
+    assert list(install_dir.iterdir()) == [install_dir / "previous.txt"]
+    assert list(tmp_path.iterdir()) == [install_dir]
+
+    with staged_install(replace=True):
+        copy_build_files([Path("./foo.py")])
+
+    assert list(install_dir.iterdir()) == [install_dir / "foo.py"]
+    assert list(tmp_path.iterdir()) == [install_dir]
+
+
+def test_compile_installed_python(tmp_path: Path, data_root_dir: Path, monkeypatch):
+    install_dir = tmp_path / "install"
+    shutil.copytree(data_root_dir / "copybuildfiles01", install_dir)
+    monkeypatch.setenv("REZ_BUILD_INSTALL_PATH", str(install_dir))
+
+    assert compile_installed_python(optimization_levels=[0, 2], workers=2)
+
+    pyc_files = [path.name for path in install_dir.rglob("*.pyc")]
+    assert len(pyc_files) == 4
+    assert any(".opt-2." in name for name in pyc_files)
+
+
+def test_check_disk_space(tmp_path: Path):
+    check_disk_space([(tmp_path / "new" / "dir", 1), (tmp_path, 1)])
+
+    free_size = shutil.disk_usage(tmp_path).free
+    with pytest.raises(OSError) as error:
+        check_disk_space([(tmp_path / "new", free_size), (tmp_path, free_size)])
+    assert error.value.errno == errno.ENOSPC
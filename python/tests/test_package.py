@@ -0,0 +1,73 @@
+import logging
+from pathlib import Path
+
+import pytest
+
+from rezbuild_utils._package import BuildPackageVersion
+from rezbuild_utils._package import get_installed_versions
+from rezbuild_utils._package import get_previous_version
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def test_build_package_version(monkeypatch):
+    monkeypatch.setenv("REZ_BUILD_PROJECT_VERSION", "1.22.3.1")
+
+    version = BuildPackageVersion()
+    assert version.full_version == "1.22.3.1"
+    assert version.vendor_version == "1.22.3"
+    assert version.major == "1"
+    assert version.minor == "22"
+    assert version.patch == "3"
+    assert version.extra_patch == "1"
+
+    version = BuildPackageVersion("1.2")
+    assert version.minor == "2"
+    with pytest.raises(ValueError):
+        version.patch
+
+
+def test_build_package_version_ordering():
+    versions = [
+        BuildPackageVersion("1.10.0.0"),
+        BuildPackageVersion("1.2.0.1"),
+        BuildPackageVersion("1.2.3-beta"),
+        BuildPackageVersion("1.2.3"),
+        BuildPackageVersion("1.2.0.0"),
+        BuildPackageVersion("1.2.beta.0"),
+    ]
+    assert [str(version) for version in sorted(versions)] == [
+        "1.2.beta.0",
+        "1.2.0.0",
+        "1.2.0.1",
+        "1.2.3",
+        "1.2.3-beta",
+        "1.10.0.0",
+    ]
+    assert BuildPackageVersion("1.2.0.0") == BuildPackageVersion("1.2.0.0")
+    assert BuildPackageVersion("1.2.0.0") < BuildPackageVersion("1.2.0.1")
+    assert BuildPackageVersion("1.02") != BuildPackageVersion("1.2")
+
+
+def test_build_package_version_range():
+    assert BuildPackageVersion("1.2.3.0").in_range("1.2+<2")
+    assert not BuildPackageVersion("2.0.0.0").in_range("1.2+<2")
+    assert BuildPackageVersion("1.2.3.0").in_range("==1.2.3.0")
+
+
+def test_get_previous_version(tmp_path: Path):
+    for version in ["1.0.0.0", "1.2.0.0", "1.10.0.0", ".1.5.0.0-staging"]:
+        (tmp_path / "foo" / version).mkdir(parents=True)
+
+    versions = get_installed_versions("foo", tmp_path)
+    assert [str(version) for version in versions] == ["1.0.0.0", "1.2.0.0", "1.10.0.0"]
+    assert get_installed_versions("bar", tmp_path) == []
+    versions_range = get_installed_versions("foo", tmp_path, version_range="1.1+")
+    assert [str(version) for version in versions_range] == ["1.2.0.0", "1.10.0.0"]
+
+    previous = get_previous_version(BuildPackageVersion("1.5.0.0"), versions)
+    assert previous == BuildPackageVersion("1.2.0.0")
+    previous = get_previous_version(BuildPackageVersion("1.2.0.0"), versions)
+    assert previous == BuildPackageVersion("1.0.0.0")
+    assert get_previous_version(BuildPackageVersion("1.0.0.0"), versions) is None